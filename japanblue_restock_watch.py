@@ -7,21 +7,34 @@ sends Discord notifications when status changes from NOT_BUYABLE to BUYABLE.
 """
 
 import argparse
+import atexit
+import gzip
+import hashlib
 import json
 import os
+import random
 import re
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Tuple
+from functools import lru_cache
+from html import unescape
+from html.parser import HTMLParser
+from typing import Callable, NamedTuple, Optional, Tuple
 from urllib.parse import urlparse
 
 import requests
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
 
-# Load environment variables from .env file
-load_dotenv()
+# orjson is optional; when installed it handles state-file (de)serialisation
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Constants
 PRODUCTS = [
@@ -43,62 +56,833 @@ PRODUCTS = [
 ]
 
 DEFAULT_STATE_FILE = "restock_state.json"
-MAX_RETRIES = 3
+MAX_RETRIES = 3  # total attempts per page fetch
+DEFAULT_MIN_INTERVAL = 60  # seconds
+DEFAULT_MAX_INTERVAL = 900  # seconds
+MAX_CONCURRENT_CHECKS = 8  # worker threads, and pooled connections kept per host
 INITIAL_BACKOFF = 1  # seconds
+MAX_BACKOFF = 30  # seconds
+MAX_HTML_BYTES = 1024 * 1024  # stop downloading product pages past this size
+MAX_DRAIN_BYTES = 64 * 1024  # unread remainder still read off to keep the connection
+# Part of every stored body_hash; bump it whenever get_buyable_status() or
+# its scanners change so results parsed by the old logic are not reused
+DETECTOR_VERSION = 1
+# Hosts that answered HEAD with 405/501; the pre-check is skipped for them
+_HEAD_UNSUPPORTED_HOSTS = set()
+# GET attempts fetch_html() has already spent on the page this thread is
+# fetching; the session's Retry policy counts them against MAX_RETRIES
+_FETCH_BUDGET = threading.local()
 
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "japanblue_restock")
 
-def fetch_html(url: str, verbose: bool = False) -> str:
+NOTIFY_TEMPLATE = (
+    "🛒 **Restock Alert: {product_name}**\n\n"
+    "**Status:** BUYABLE\n"
+    "**Reason:** {reason}\n"
+    "**URL:** {url}"
+)
+
+ADD_TO_CART_TAGS = ("button", "input", "a")
+# Elements html.parser never sees an end tag for
+VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+))
+
+# Shopify themes embed the product (with its variants) as a JSON script block
+_PRODUCT_JSON_RE = re.compile(
+    r'<script[^>]*(?:id=["\']ProductJson[^"\']*["\']|data-product-json)[^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL,
+)
+_CART_RE = re.compile("cart", re.IGNORECASE)
+_SCRIPT_CLOSE_RE = re.compile(rb"</script[^>]*>", re.IGNORECASE)
+# "out of stock" as it can appear in markup: the words may be split by
+# whitespace, tags or entities, but schema.org's "OutOfStock" (present on
+# most product pages) has nothing between them and does not match
+_OUT_OF_STOCK_RE = re.compile(
+    r"out(?:\s|<[^>]*>|&#?\w+;)+of(?:\s|<[^>]*>|&#?\w+;)+stock", re.IGNORECASE
+)
+# Everything that is not rendered text: script/style/template blocks,
+# comments and tags, stripped in a single left-to-right pass. A tag only
+# ends at a ">" outside quoted attribute values (Alpine/Vue attributes
+# such as x-show="qty > 0" are common), and "<" only opens a tag when a
+# name, "/", "!" or "?" follows, as in html.parser
+_NON_TEXT_RE = re.compile(
+    r"<(script|style|template)\b.*?</\1\s*>"
+    r"|<!--.*?-->"
+    r"""|<[a-z/!?](?:[^>"']|"[^"]*"|'[^']*')*>""",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter backoff before retry number attempt (1-based).
+    
+    Sleeping a random time between zero and the exponential bound keeps
+    watchers that failed at the same moment from retrying in lockstep.
+    
+    Args:
+        attempt: How many attempts have failed so far
+        
+    Returns:
+        Seconds to sleep before the next attempt
+    """
+    return random.uniform(0, min(INITIAL_BACKOFF * 2 ** (attempt - 1), MAX_BACKOFF))
+
+
+class _FullJitterRetry(Retry):
+    """urllib3 Retry policy with full-jitter backoff and a bounded Retry-After."""
+    
+    def get_backoff_time(self) -> float:
+        # requests disables urllib3 redirects, so every history entry is a
+        # failed attempt
+        if not self.history:
+            return 0
+        return _backoff_delay(len(self.history))
+    
+    def is_exhausted(self) -> bool:
+        # A GET re-sent after a body read failed shares the page's budget, so
+        # one fetch never makes more than MAX_RETRIES attempts in total
+        spent = getattr(_FETCH_BUDGET, "spent", 0)
+        return super().is_exhausted() or spent + len(self.history) >= MAX_RETRIES
+    
+    def get_retry_after(self, response) -> Optional[float]:
+        # sleep_for_retry() sleeps for whatever this returns, outside both the
+        # request timeout and the backoff cap; a "Retry-After: 3600" must not
+        # stall the job for an hour
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_BACKOFF)
+
+
+# Shared HTTP session so product fetches, retries and webhook posts reuse
+# pooled keep-alive connections instead of re-handshaking TLS every request
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    # Only advertise codecs urllib3 can decode (br/zstd once their packages are installed)
+    "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
+})
+
+# Only transient failures are retried (connection errors, 429 and 5xx), with
+# full-jitter exponential backoff that honours Retry-After. GET is the only
+# retried method, so webhook POSTs are never sent twice.
+_RETRY = _FullJitterRetry(
+    total=MAX_RETRIES - 1,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET",),
+    respect_retry_after_header=True,
+)
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_CHECKS, max_retries=_RETRY)
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
+atexit.register(_SESSION.close)
+
+
+class _VariantPatterns(NamedTuple):
+    """Compiled Shopify availability patterns for a single variant ID."""
+    available: re.Pattern
+    inventory: re.Pattern
+    unavailable_json: re.Pattern
+    out_of_stock: re.Pattern
+
+
+@lru_cache(maxsize=32)
+def _variant_patterns(variant_id: str) -> _VariantPatterns:
+    """
+    Compile (once per variant ID) the regexes used to find a Shopify variant.
+    
+    Args:
+        variant_id: Shopify variant ID taken from the product URL
+        
+    Returns:
+        _VariantPatterns with one compiled pattern per availability check
+    """
+    vid = re.escape(variant_id)
+    return _VariantPatterns(
+        available=re.compile(rf'"id"\s*:\s*{vid}[^}}]*"available"\s*:\s*(true|false)', re.IGNORECASE),
+        inventory=re.compile(rf'"id"\s*:\s*{vid}[^}}]*"inventory_quantity"\s*:\s*(\d+)', re.IGNORECASE),
+        unavailable_json=re.compile(
+            rf'{{[^}}]*"id"\s*:\s*{vid}[^}}]*"available"\s*:\s*false[^}}]*}}', re.IGNORECASE
+        ),
+        out_of_stock=re.compile(rf'{vid}[^}}]*"out of stock"\s*:\s*true', re.IGNORECASE),
+    )
+
+
+def _cache_path(url: str) -> str:
+    """Return the response cache file path for a URL."""
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{digest}.html.gz")
+
+
+def read_cached_html(url: str, ttl: int) -> Optional[str]:
+    """
+    Read a cached page if it was stored less than ttl seconds ago.
+    
+    Args:
+        url: URL the page was fetched from
+        ttl: Maximum cache age in seconds (0 disables the cache)
+        
+    Returns:
+        Cached HTML content, or None if missing, expired or unreadable
+    """
+    if ttl <= 0:
+        return None
+    
+    path = _cache_path(url)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, EOFError):
+        return None
+
+
+def write_cached_html(url: str, html: str):
+    """
+    Store a fetched page in the response cache.
+    
+    Args:
+        url: URL the page was fetched from
+        html: HTML content to cache
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with gzip.open(_cache_path(url), "wt", encoding="utf-8") as f:
+            f.write(html)
+    except OSError:
+        # Caching is best-effort; a read-only home directory must not fail the check
+        pass
+
+
+class NotBuyableShortcut(Exception):
+    """Raised when a cheap pre-check already proves a product is not buyable."""
+    
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def head_precheck(
+    url: str,
+    verbose: bool = False,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> bool:
+    """
+    Probe a product URL with HEAD before downloading the page.
+    
+    Delisted SKUs answer 404/410, which settles the check without fetching
+    a body, and a page whose ETag/Last-Modified still match the stored ones
+    does not need downloading at all. Hosts that reject HEAD are remembered
+    and skipped afterwards; any other outcome (including network errors)
+    defers to the full GET.
+    
+    Args:
+        url: URL to probe
+        verbose: Enable verbose logging
+        etag: ETag stored from the previous fetch
+        last_modified: Last-Modified stored from the previous fetch
+        
+    Returns:
+        True if the page is unchanged since the previous fetch
+        
+    Raises:
+        NotBuyableShortcut: If the server reports the page as gone
+    """
+    host = urlparse(url).netloc
+    if host in _HEAD_UNSUPPORTED_HOSTS:
+        return False
+    
+    try:
+        response = _SESSION.head(url, timeout=10, allow_redirects=True)
+    except requests.RequestException as e:
+        if verbose:
+            print(f"HEAD pre-check failed: {e}", file=sys.stderr)
+        return False
+    
+    if response.status_code in (405, 501):
+        _HEAD_UNSUPPORTED_HOSTS.add(host)
+        if verbose:
+            print(f"{host} does not support HEAD; skipping pre-check", file=sys.stderr)
+        return False
+    if response.status_code in (404, 410):
+        raise NotBuyableShortcut(f"HEAD {response.status_code} (product page gone)")
+    if not response.ok:
+        return False
+    
+    # Prefer the ETag; fall back to Last-Modified only when there is no ETag
+    if etag:
+        return response.headers.get("ETag") == etag
+    if last_modified:
+        return response.headers.get("Last-Modified") == last_modified
+    return False
+
+
+class FetchResult(NamedTuple):
+    """Outcome of fetch_html: page content plus the server's cache validators."""
+    html: Optional[str]  # None when the server answered 304 Not Modified
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body_hash: Optional[str] = None  # digest of the downloaded body, see _body_hash
+
+
+def _body_hash(body: bytes) -> str:
+    """Digest a page body so an identical re-download can skip parsing."""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _result_hash(body_hash: str, status: Optional[str], reason: Optional[str]) -> str:
     """
-    Fetch HTML content from URL with retry logic and exponential backoff.
+    Bind a page body's hash to the status and reason parsed from it.
+    
+    This is what the state file stores, so a matching download only reuses
+    last_status and last_reason while both are still what that page
+    produced; an entry edited by hand or by another process, or one written
+    under a different DETECTOR_VERSION, fails to match and the page is
+    parsed again.
+    
+    Args:
+        body_hash: Digest of the page body from _body_hash()
+        status: Status derived from the page
+        reason: Reason derived from the page
+        
+    Returns:
+        Hex digest covering all three values and DETECTOR_VERSION
+    """
+    key = f"{DETECTOR_VERSION}\0{body_hash}\0{status}\0{reason}".encode("utf-8")
+    return hashlib.blake2b(key, digest_size=16).hexdigest()
+
+
+def fetch_html(
+    url: str,
+    verbose: bool = False,
+    cache_ttl: int = 0,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    stop_when: Optional[Callable[[str], bool]] = None,
+) -> FetchResult:
+    """
+    Fetch HTML content from URL; transient failures are retried by the session.
+    
+    When validators from a previous fetch are given, the request is made
+    conditional so an unchanged page costs a bodyless 304 response.
+    
+    stop_when is called with each stretch of the page that ends in newly
+    closed </script> tags, so every script block is examined exactly once;
+    once it returns True the rest of the body is not downloaded.
     
     Args:
         url: URL to fetch
         verbose: Enable verbose logging
+        cache_ttl: Reuse a cached copy younger than this many seconds (0 disables)
+        etag: ETag from the previous fetch, sent as If-None-Match
+        last_modified: Last-Modified from the previous fetch, sent as If-Modified-Since
+        stop_when: Predicate telling whether a page segment already settles the check
         
     Returns:
-        HTML content as string
+        FetchResult with the HTML (None if not modified), new validators
+        and a hash of the downloaded body
         
     Raises:
-        requests.RequestException: If all retries fail
+        NotBuyableShortcut: If the HEAD pre-check shows the page is gone
+        requests.RequestException: If the fetch fails permanently or retries run out
     """
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/120.0.0.0 Safari/537.36"
-        ),
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-    }
+    cached = read_cached_html(url, cache_ttl)
+    if cached is not None:
+        if verbose:
+            print(f"Using cached page ({len(cached)} chars, TTL {cache_ttl}s)", file=sys.stderr)
+        return FetchResult(cached, etag, last_modified, _body_hash(cached.encode("utf-8")))
     
-    backoff = INITIAL_BACKOFF
-    last_exception = None
+    if head_precheck(url, verbose, etag, last_modified):
+        if verbose:
+            print("HEAD validators unchanged; skipping download", file=sys.stderr)
+        return FetchResult(None, etag, last_modified)
+    
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
     
-    for attempt in range(1, MAX_RETRIES + 1):
+    if verbose:
+        print("Fetching URL...", file=sys.stderr)
+    
+    # Transient failures are retried by the session's urllib3 Retry policy,
+    # which gives up on a request once its headers have arrived; a
+    # connection dropped while the streamed body is read is retried here.
+    # Both draw on the same MAX_RETRIES attempts.
+    # Stream the body so oversized pages stop downloading at the cap.
+    attempts = 0
+    while True:
+        _FETCH_BUDGET.spent = attempts
         try:
+            with _SESSION.get(url, headers=headers, timeout=30, stream=True) as response:
+                attempts += _attempts_made(response)
+                if response.status_code == 304:
+                    if verbose:
+                        print("Page not modified since last check", file=sys.stderr)
+                    return FetchResult(
+                        None,
+                        response.headers.get("ETag", etag),
+                        response.headers.get("Last-Modified", last_modified),
+                    )
+                
+                response.raise_for_status()
+                encoding = response.encoding or "utf-8"
+                
+                try:
+                    body = _read_body(response, encoding, verbose, stop_when)
+                except (requests.exceptions.ChunkedEncodingError, requests.ConnectionError) as e:
+                    if attempts >= MAX_RETRIES:
+                        raise
+                    error = e
+                else:
+                    new_etag = response.headers.get("ETag")
+                    new_last_modified = response.headers.get("Last-Modified")
+                    break
+        finally:
+            _FETCH_BUDGET.spent = 0
+        
+        backoff = _backoff_delay(attempts)
+        if verbose:
+            print(f"Reading the page failed: {error}. Retrying in {backoff:.1f}s...", file=sys.stderr)
+        time.sleep(backoff)
+    
+    if verbose:
+        print(f"Successfully fetched {len(body)} bytes", file=sys.stderr)
+    
+    html = body.decode(encoding, errors="replace")
+    if cache_ttl > 0:
+        write_cached_html(url, html)
+    return FetchResult(html, new_etag, new_last_modified, _body_hash(body))
+
+
+def _attempts_made(response: requests.Response) -> int:
+    """
+    Count the requests urllib3 sent to produce a response.
+    
+    Args:
+        response: Response returned by the session
+        
+    Returns:
+        1 plus the number of attempts the Retry policy made before it
+    """
+    retries = getattr(response.raw, "retries", None)
+    return 1 + (len(retries.history) if retries is not None else 0)
+
+
+def _read_body(
+    response: requests.Response,
+    encoding: str,
+    verbose: bool = False,
+    stop_when: Optional[Callable[[str], bool]] = None,
+) -> bytearray:
+    """
+    Read a streamed page body up to MAX_HTML_BYTES or until stop_when fires.
+    
+    Args:
+        response: Streamed response to read
+        encoding: Encoding used to decode segments for stop_when
+        verbose: Enable verbose logging
+        stop_when: Predicate telling whether a page segment already settles the check
+        
+    Returns:
+        The body bytes read
+        
+    Raises:
+        requests.RequestException: If the connection fails mid-body
+    """
+    body = bytearray()
+    # stop_when has already seen everything before this offset
+    scanned = 0
+    for chunk in response.iter_content(chunk_size=16384):
+        body += chunk
+        if len(body) >= MAX_HTML_BYTES:
             if verbose:
-                print(f"Fetching URL (attempt {attempt}/{MAX_RETRIES})...", file=sys.stderr)
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
+                print(f"Stopped reading at {MAX_HTML_BYTES} byte cap", file=sys.stderr)
+            _release_connection(response)
+            break
+        
+        if not stop_when:
+            continue
+        # Find the last </script> closed by this chunk (it may straddle
+        # the previous one) and hand over only what precedes it
+        closed = None
+        for closed in _SCRIPT_CLOSE_RE.finditer(body, max(scanned, len(body) - len(chunk) - 64)):
+            pass
+        if closed is None:
+            continue
+        segment = body[scanned:closed.end()].decode(encoding, errors="replace")
+        scanned = closed.end()
+        if stop_when(segment):
             if verbose:
-                print(f"Successfully fetched {len(response.text)} bytes", file=sys.stderr)
-            
-            return response.text
-            
-        except requests.RequestException as e:
-            last_exception = e
-            if attempt < MAX_RETRIES:
-                if verbose:
-                    print(f"Attempt {attempt} failed: {e}. Retrying in {backoff}s...", file=sys.stderr)
-                time.sleep(backoff)
-                backoff *= 2
-            else:
-                if verbose:
-                    print(f"All {MAX_RETRIES} attempts failed", file=sys.stderr)
+                print(f"Stopped reading after {len(body)} bytes; page already decisive", file=sys.stderr)
+            _release_connection(response)
+            break
+    return body
+
+
+def _release_connection(response: requests.Response):
+    """
+    Read off a small unread remainder so the connection can be reused.
+    
+    Abandoning a response mid-body forces its connection closed. When the
+    rest is known to be at most MAX_DRAIN_BYTES on the wire it is cheaper
+    to read and drop it than to redo the TCP/TLS handshake next time;
+    chunked responses of unknown length are left to close.
+    
+    Args:
+        response: Streamed response whose body was not fully read
+    """
+    length = response.headers.get("Content-Length", "")
+    if length.isdigit() and int(length) - response.raw.tell() <= MAX_DRAIN_BYTES:
+        response.raw.drain_conn()
+
+
+def _shopify_variant_id(url: str) -> Optional[str]:
+    """Extract the Shopify variant ID from a product URL, if present."""
+    if "variant=" not in url:
+        return None
+    return url.split("variant=")[1].split("&")[0].split("#")[0] or None
+
+
+def shopify_variant_settled(variant_id: str) -> Callable[[str], bool]:
+    """
+    Build a fetch_html stop_when predicate for a Shopify variant.
+    
+    get_buyable_status() answers directly from the product JSON whenever
+    _variant_verdict() gives a verdict for the variant, so nothing after
+    that script block can change the outcome.
+    
+    Args:
+        variant_id: Shopify variant ID taken from the product URL
+        
+    Returns:
+        Predicate returning True once a page segment settles the variant
+    """
+    def settled(segment: str) -> bool:
+        variant = _find_shopify_variant(segment, variant_id)
+        return variant is not None and _variant_verdict(variant, variant_id) is not None
+    
+    return settled
+
+
+def _variant_verdict(variant: dict, variant_id: str) -> Optional[Tuple[bool, str]]:
+    """
+    Decide availability from a variant's product JSON alone, if it can.
+    
+    Args:
+        variant: The variant's JSON object
+        variant_id: Shopify variant ID taken from the product URL
+        
+    Returns:
+        Tuple of (buyable: bool, reason: str), or None when the JSON is not
+        conclusive (e.g. "available": null) and the page must be checked
+    """
+    if variant.get("available") is False:
+        return False, f"Variant {variant_id} marked as unavailable"
+    if variant.get("inventory_quantity") == 0:
+        return False, f"Variant {variant_id} has zero inventory"
+    if variant.get("available"):
+        return True, f"Variant {variant_id} marked as available in product JSON"
+    return None
+
+
+def _find_shopify_variant(html: str, variant_id: str) -> Optional[dict]:
+    """
+    Look up a variant in the product JSON embedded by Shopify themes.
+    
+    Args:
+        html: HTML content of the product page
+        variant_id: Shopify variant ID taken from the product URL
+        
+    Returns:
+        The variant's JSON object, or None if no product JSON block lists it
+    """
+    for match in _PRODUCT_JSON_RE.finditer(html):
+        try:
+            product = json.loads(match.group(1))
+        except ValueError:
+            continue
+        if not isinstance(product, dict):
+            continue
+        for variant in product.get("variants") or []:
+            if isinstance(variant, dict) and str(variant.get("id")) == variant_id:
+                return variant
+    return None
+
+
+def _visible_text(html: str) -> str:
+    """
+    Approximate the rendered text of a page without building a DOM.
+    
+    Drops scripts, styles, templates, comments and tags, so marketing
+    copy inside script blobs cannot trigger text matches.
+    
+    Args:
+        html: HTML content of the page
+        
+    Returns:
+        Visible text with HTML entities decoded
+    """
+    return unescape(_NON_TEXT_RE.sub("", html))
+
+
+class _ScanDone(Exception):
+    """Raised inside a page scanner to stop feeding once the answer is known."""
+
+
+class _OpenCandidate(NamedTuple):
+    """A button or link still open while _AddToCartScanner collects its text."""
+    index: int  # position in document order among candidates
+    tag: str
+    attrs: dict
+    text: list  # data chunks seen so far, joined when the element closes
+
+
+class _TextHit(NamedTuple):
+    """A candidate whose text (or input value) names the cart."""
+    index: int
+    disabled: bool
+
+
+class _AddToCartScanner(HTMLParser):
+    """
+    Streaming scan for add-to-cart buttons that never builds a DOM.
+    
+    A button, input or link counts as a selector match when it carries one
+    of the usual add-to-cart markers:
+    
+    - button[name="add-to-cart"], button[data-action*="add-to-cart"]
+    - button[class*="add-to-cart"], button[class*="addtocart"]
+    - input[name="add-to-cart"], input[type="submit"][value*="cart" i]
+    - a[class*="add-to-cart"]
+    
+    The first disabled match settles the result, so parsing stops there.
+    Otherwise the whole page is read, and the text of every candidate
+    element is collected for the "Add to Cart" text fallback.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.selector_found = False
+        self.selector_disabled = False
+        # Text fallback: candidates still open, and the ones that qualified
+        self._open = []  # list of _OpenCandidate
+        self._text_hits = []  # list of _TextHit
+        self._count = 0
+    
+    @staticmethod
+    def _is_disabled(attrs: dict) -> bool:
+        return "disabled" in attrs or (attrs.get("aria-disabled") or "").lower() == "true"
+    
+    @staticmethod
+    def _matches_selector(tag: str, attrs: dict) -> bool:
+        css_class = attrs.get("class") or ""
+        if tag == "button":
+            return (
+                attrs.get("name") == "add-to-cart"
+                or "add-to-cart" in (attrs.get("data-action") or "")
+                or "add-to-cart" in css_class
+                or "addtocart" in css_class
+            )
+        if tag == "input":
+            return attrs.get("name") == "add-to-cart" or (
+                (attrs.get("type") or "").lower() == "submit"
+                and "cart" in (attrs.get("value") or "").lower()
+            )
+        return "add-to-cart" in css_class
+    
+    def handle_starttag(self, tag, attrs):
+        if tag not in ADD_TO_CART_TAGS:
+            return
+        attrs = dict(attrs)
+        
+        if self._matches_selector(tag, attrs):
+            self.selector_found = True
+            if self._is_disabled(attrs):
+                self.selector_disabled = True
+                raise _ScanDone
+        
+        # Selector matches win over the text fallback, so stop tracking text
+        if self.selector_found:
+            return
+        self._count += 1
+        if tag == "input":
+            # Inputs have no text; only their value can name the cart
+            if "cart" in (attrs.get("value") or "").lower():
+                self._text_hits.append(_TextHit(self._count, self._is_disabled(attrs)))
+            return
+        self._open.append(_OpenCandidate(self._count, tag, attrs, []))
+    
+    def handle_data(self, data):
+        for candidate in self._open:
+            candidate.text.append(data)
+    
+    def handle_endtag(self, tag):
+        for i in range(len(self._open) - 1, -1, -1):
+            if self._open[i].tag == tag:
+                self._close(self._open.pop(i))
+                break
+    
+    def _close(self, candidate: _OpenCandidate):
+        if "add to cart" in "".join(candidate.text).lower():
+            self._text_hits.append(_TextHit(candidate.index, self._is_disabled(candidate.attrs)))
+    
+    def result(self) -> Tuple[bool, bool]:
+        """Return (found, disabled) for everything fed so far."""
+        if self.selector_found:
+            return True, self.selector_disabled
+        # Elements never closed before the end of the page still count
+        while self._open:
+            self._close(self._open.pop())
+        if not self._text_hits:
+            return False, False
+        # The first candidate in document order decides, as a tree walk would
+        return True, min(self._text_hits, key=lambda hit: hit.index).disabled
+
+
+def _find_add_to_cart_button(html: str) -> Tuple[bool, bool]:
+    """
+    Locate the add-to-cart button on a Japan Blue product page.
+    
+    Args:
+        html: HTML content of the product page
+        
+    Returns:
+        Tuple of (found: bool, disabled: bool)
+    """
+    # Every selector and text check below needs "cart" somewhere in the
+    # markup; pages without it (error pages, bot challenges) skip the scan
+    if not _CART_RE.search(html):
+        return False, False
+    
+    scanner = _AddToCartScanner()
+    try:
+        scanner.feed(html)
+        scanner.close()
+    except _ScanDone:
+        pass
+    return scanner.result()
+
+
+@dataclass
+class _ButtonNode:
+    """An element inside a candidate button, tracked to work out its .string."""
+    tag: str
+    attrs: dict
+    child_count: int = 0
+    # The most recent child: its text, or the node when it is an element.
+    # Once the element closes with a single child, this is its sole child
+    last_text: Optional[str] = None
+    last_node: Optional["_ButtonNode"] = None
+    # Set on close, like a DOM node's .string: the sole text child, or the
+    # sole element child's own string
+    string: Optional[str] = None
+
+
+class _ShopifyButtonScanner(HTMLParser):
+    """
+    Streaming scan for the state of a Shopify add-to-cart button.
+    
+    Any of these elements means the button is disabled and ends the scan:
+    
+    - button[disabled], input[type="submit"][disabled]
+    - any element whose class contains both "disabled" and "cart"
+    
+    Otherwise a button counts as enabled when its sole text (nested through
+    single-child elements, like a DOM node's .string) reads "Add to cart"
+    and it is not aria-disabled.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.disabled = False
+        self.enabled_found = False
+        # Open _ButtonNode elements, from a candidate button inwards
+        self._stack = []
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        css_class = attrs.get("class") or ""
+        if (
+            (tag == "button" and "disabled" in attrs)
+            or (tag == "input" and (attrs.get("type") or "").lower() == "submit" and "disabled" in attrs)
+            or ("disabled" in css_class and "cart" in css_class)
+        ):
+            self.disabled = True
+            raise _ScanDone
+        
+        if not self._stack and tag != "button":
+            return
+        node = _ButtonNode(tag, attrs)
+        self._add_child(None, node)
+        if tag not in VOID_TAGS:
+            self._stack.append(node)
     
-    raise last_exception
+    def _add_child(self, text: Optional[str], node: Optional[_ButtonNode] = None):
+        if not self._stack:
+            return
+        parent = self._stack[-1]
+        # Adjacent text chunks belong to the same text child
+        if text is not None and parent.last_text is not None:
+            parent.last_text += text
+            return
+        parent.child_count += 1
+        parent.last_text = text
+        parent.last_node = node
+    
+    def handle_data(self, data):
+        self._add_child(data)
+    
+    def handle_endtag(self, tag):
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i].tag == tag:
+                while len(self._stack) > i:
+                    self._close(self._stack.pop())
+                break
+    
+    def _close(self, node: _ButtonNode):
+        if node.child_count == 1:
+            node.string = node.last_text if node.last_node is None else node.last_node.string
+        if node.tag == "button" and not self.enabled_found:
+            if "add to cart" in (node.string or "").lower() and not node.attrs.get("aria-disabled"):
+                self.enabled_found = True
+    
+    def result(self) -> Tuple[bool, bool]:
+        """Return (disabled, enabled_found) for everything fed so far."""
+        while self._stack:
+            self._close(self._stack.pop())
+        return self.disabled, self.enabled_found
+
+
+def _scan_shopify_buttons(html: str) -> Tuple[bool, bool]:
+    """
+    Check a Shopify page for disabled and enabled add-to-cart buttons.
+    
+    Args:
+        html: HTML content of the product page
+        
+    Returns:
+        Tuple of (disabled: bool, enabled_found: bool)
+    """
+    scanner = _ShopifyButtonScanner()
+    try:
+        scanner.feed(html)
+        scanner.close()
+    except _ScanDone:
+        pass
+    return scanner.result()
 
 
 def get_buyable_status(html: str, product_type: str = "japanblue", url: str = "") -> Tuple[bool, str]:
@@ -112,102 +896,71 @@ def get_buyable_status(html: str, product_type: str = "japanblue", url: str = ""
     Returns:
         Tuple of (buyable: bool, reason: str)
     """
-    soup = BeautifulSoup(html, "html.parser")
-    page_text = soup.get_text().lower()
-    html_lower = html.lower()
+    # Rendering the visible text costs a pass over the whole page, so it is
+    # deferred until a check actually needs it. Only the (much smaller)
+    # visible text is lowercased, never a full copy of the page.
+    page_text = None
     
     # Shopify-specific detection (The Cultured Cup)
     if product_type == "shopify":
         # Extract variant ID from URL if present
-        variant_id = None
-        if "variant=" in url:
-            try:
-                variant_id = url.split("variant=")[1].split("&")[0].split("#")[0]
-            except:
-                pass
+        variant_id = _shopify_variant_id(url)
         
         # Check for variant-specific availability in JSON data
         # Shopify stores product data in JSON-LD or script tags
         
-        # Look for variant data in various formats
-        # Pattern 1: "variants":[...] with availability info
-        variant_patterns = [
-            r'"variants"\s*:\s*\[([^\]]+)\]',
-            r'"variant"\s*:\s*\{([^}]+)\}',
-        ]
+        # Prefer the theme's embedded product JSON: one parse plus an exact
+        # lookup by variant ID instead of heuristic regex scans
+        variant = _find_shopify_variant(html, variant_id) if variant_id else None
+        verdict = _variant_verdict(variant, variant_id) if variant is not None else None
+        if verdict is not None:
+            return verdict
         
-        # Check for the specific variant's availability
-        if variant_id:
+        # Otherwise scan the markup for the specific variant's availability
+        if variant_id and variant_id in html:
             # Look for variant ID in the HTML with availability info
             # Common patterns: "id":27890666602598 with "available":false
-            variant_available_pattern = rf'"id"\s*:\s*{variant_id}[^}}]*"available"\s*:\s*(true|false)'
-            variant_inventory_pattern = rf'"id"\s*:\s*{variant_id}[^}}]*"inventory_quantity"\s*:\s*(\d+)'
-            variant_available_text_pattern = rf'{variant_id}[^<]*"available"[^<]*false'
+            patterns = _variant_patterns(variant_id)
             
             # Check if variant is marked as unavailable
-            if re.search(variant_available_pattern, html, re.IGNORECASE):
-                match = re.search(variant_available_pattern, html, re.IGNORECASE)
-                if match and match.group(1).lower() == "false":
-                    return False, f"Variant {variant_id} marked as unavailable"
+            match = patterns.available.search(html)
+            if match and match.group(1).lower() == "false":
+                return False, f"Variant {variant_id} marked as unavailable"
             
             # Check inventory quantity
-            if re.search(variant_inventory_pattern, html, re.IGNORECASE):
-                match = re.search(variant_inventory_pattern, html, re.IGNORECASE)
-                if match and int(match.group(1)) == 0:
-                    return False, f"Variant {variant_id} has zero inventory"
+            match = patterns.inventory.search(html)
+            if match and int(match.group(1)) == 0:
+                return False, f"Variant {variant_id} has zero inventory"
             
             # Check for "available":false near variant ID (but be more specific)
             # Only match if it's in a proper JSON structure
-            variant_json_pattern = rf'{{[^}}]*"id"\s*:\s*{variant_id}[^}}]*"available"\s*:\s*false[^}}]*}}'
-            if re.search(variant_json_pattern, html, re.IGNORECASE):
+            if patterns.unavailable_json.search(html):
                 return False, f"Variant {variant_id} marked as unavailable in JSON"
-        
-        # Check for general "out of stock" indicators for the selected variant
-        # Look for "Out of stock" text that appears after variant selection
-        # But only if it's clearly for the selected variant
-        if variant_id:
+            
+            # Check for general "out of stock" indicators for the selected variant
             # Check if the variant ID appears with "out of stock":true
-            variant_oot_pattern = rf'{variant_id}[^}}]*"out of stock"\s*:\s*true'
-            if re.search(variant_oot_pattern, html_lower):
+            if patterns.out_of_stock.search(html):
                 return False, f"Variant {variant_id} marked as out of stock"
         
         # Check for "Out of stock" text in the visible page content
         # But be more careful - only flag if it's clearly for the selected variant
         # Skip this check if we have variant-specific data above
         
-        # Check for disabled add to cart buttons in Shopify
-        add_to_cart_disabled = False
-        # Look for disabled buttons with various selectors
-        disabled_selectors = [
-            'button[disabled]',
-            'button[disabled="disabled"]',
-            'input[type="submit"][disabled]',
-            '[class*="disabled"][class*="cart"]',
-        ]
-        for selector in disabled_selectors:
-            if soup.select(selector):
-                add_to_cart_disabled = True
-                break
-        
         # Also check for "Sold out" text which is common in Shopify
-        if "sold out" in page_text.lower():
+        page_text = _visible_text(html).lower()
+        if "sold out" in page_text:
             return False, "Sold out message found"
         
-        if add_to_cart_disabled and 'add to cart' in page_text:
-            return False, "Add-to-cart button disabled"
+        # The button scan is only worth running when an add-to-cart label
+        # is actually on the page
+        enabled_button_found = False
+        if "add to cart" in page_text:
+            button_disabled, enabled_button_found = _scan_shopify_buttons(html)
+            if button_disabled:
+                return False, "Add-to-cart button disabled"
         
         # If we get here and page loaded, check for positive availability indicators
         if len(page_text) > 100:
-            # Look for positive indicators like "Add to cart" button that's enabled
-            add_to_cart_buttons = soup.find_all(['button', 'input'], string=re.compile('add to cart', re.I))
-            enabled_button_found = False
-            if add_to_cart_buttons:
-                # Check if any button is not disabled
-                for btn in add_to_cart_buttons:
-                    if not btn.get('disabled') and not btn.get('aria-disabled'):
-                        enabled_button_found = True
-                        break
-            
             # If we found an enabled add-to-cart button, assume buyable
             if enabled_button_found:
                 return True, "Add-to-cart button found and enabled (Shopify)"
@@ -224,64 +977,23 @@ def get_buyable_status(html: str, product_type: str = "japanblue", url: str = ""
             return False, "Page content too short"
     
     # Japan Blue Jeans detection (original logic)
-    # Check for "Out of Stock" text (case-insensitive)
-    if "out of stock" in page_text:
-        return False, "Out of Stock message found"
-    
-    # Try multiple selectors for add-to-cart buttons
-    selectors = [
-        'button[name="add-to-cart"]',
-        'button[data-action*="add-to-cart"]',
-        'button.add-to-cart',
-        'button[class*="add-to-cart"]',
-        'button[class*="addtocart"]',
-        'input[name="add-to-cart"]',
-        'input[type="submit"][value*="cart" i]',
-        'a[class*="add-to-cart"]',
-    ]
-    
-    # Also search for buttons with "Add to Cart" text
-    all_buttons = soup.find_all(['button', 'input', 'a'])
-    
-    add_to_cart_found = False
-    button_disabled = False
-    
-    # Check via CSS selectors first
-    for selector in selectors:
-        elements = soup.select(selector)
-        if elements:
-            add_to_cart_found = True
-            for element in elements:
-                # Check if button is disabled
-                disabled_attr = element.get("disabled")
-                aria_disabled = element.get("aria-disabled", "").lower() == "true"
-                
-                if disabled_attr is not None or aria_disabled:
-                    button_disabled = True
-                    break
-            
-            if button_disabled:
-                break
+    # Check for "Out of Stock" text (case-insensitive); pages whose markup
+    # never spells the phrase out skip rendering the text for it
+    if _OUT_OF_STOCK_RE.search(html):
+        page_text = _visible_text(html).lower()
+        if "out of stock" in page_text:
+            return False, "Out of Stock message found"
     
-    # If not found via selectors, check all buttons for "Add to Cart" text
-    if not add_to_cart_found:
-        for element in all_buttons:
-            button_text = element.get_text().lower()
-            # Check if it's an add-to-cart button by text
-            if "add to cart" in button_text or (element.name == "input" and "cart" in element.get("value", "").lower()):
-                add_to_cart_found = True
-                # Check if disabled
-                disabled_attr = element.get("disabled")
-                aria_disabled = element.get("aria-disabled", "").lower() == "true"
-                
-                if disabled_attr is not None or aria_disabled:
-                    button_disabled = True
-                break
+    add_to_cart_found, button_disabled = _find_add_to_cart_button(html)
     
     # If we found an enabled add-to-cart button, prioritize that
     if add_to_cart_found and not button_disabled:
         return True, "Add-to-cart button found and enabled"
     
+    # The remaining checks read the visible text
+    if page_text is None:
+        page_text = _visible_text(html).lower()
+    
     # Check for "Please select the product option(s)" message
     # (only if button is disabled or not found)
     if "please select the product option(s)" in page_text:
@@ -312,41 +1024,129 @@ def load_state(state_file: str) -> dict:
         return {"products": {}}
     
     try:
-        with open(state_file, "r") as f:
-            state = json.load(f)
-            # Migrate old format to new format if needed
-            if "last_status" in state and "products" not in state:
-                # Old format - migrate to new format
-                return {"products": {}}
-            return state
-    except (json.JSONDecodeError, IOError) as e:
+        with open(state_file, "rb") as f:
+            data = f.read()
+        state = orjson.loads(data) if orjson is not None else json.loads(data)
+        # Migrate old format to new format if needed
+        if "last_status" in state and "products" not in state:
+            # Old format - migrate to new format
+            return {"products": {}}
+        return state
+    except (ValueError, IOError) as e:
         # Return default state if file is corrupted
         return {"products": {}}
 
 
-def save_state(state_file: str, product_name: str, status: str, notified: bool = False):
+def state_mtime(state_file: str) -> Optional[int]:
     """
-    Save current state to JSON file.
+    Return the state file's modification time, or None if it does not exist.
     
     Args:
         state_file: Path to state file
+        
+    Returns:
+        st_mtime_ns of the file, or None if it cannot be stat'ed
+    """
+    try:
+        return os.stat(state_file).st_mtime_ns
+    except OSError:
+        return None
+
+
+def reload_state_if_changed(
+    state: dict,
+    loaded_mtime: Optional[int],
+    state_file: str,
+    verbose: bool = False,
+) -> Tuple[dict, Optional[int]]:
+    """
+    Re-read the state file only if something else wrote it since we did.
+    
+    Args:
+        state: State currently held in memory
+        loaded_mtime: state_mtime() as of our last load or flush
+        state_file: Path to state file
+        verbose: Enable verbose logging
+        
+    Returns:
+        The state to use and the modification time it corresponds to
+    """
+    current_mtime = state_mtime(state_file)
+    if current_mtime == loaded_mtime:
+        return state, loaded_mtime
+    
+    if verbose:
+        print("State file changed on disk; reloading", file=sys.stderr)
+    return load_state(state_file), current_mtime
+
+
+def update_state(
+    state: dict,
+    product_name: str,
+    status: str,
+    notified: bool = False,
+    reason: Optional[str] = None,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    url: Optional[str] = None,
+    body_hash: Optional[str] = None,
+):
+    """
+    Record the latest result for a product in the in-memory state.
+    
+    Args:
+        state: State dictionary to update in place
         product_name: Name/identifier of the product
         status: Current status ("BUYABLE" or "NOT_BUYABLE")
         notified: Whether notification was sent
+        reason: Reason for the current status
+        etag: ETag of the fetched page, for the next conditional GET
+        last_modified: Last-Modified of the fetched page, for the next conditional GET
+        url: URL the validators belong to
+        body_hash: Hash tying the page body to this status and reason (see _result_hash)
     """
-    state = load_state(state_file)
-    
-    if "products" not in state:
-        state["products"] = {}
-    
-    state["products"][product_name] = {
+    now_iso = datetime.now().isoformat()
+    state.setdefault("products", {})[product_name] = {
         "last_status": status,
-        "last_checked_at": datetime.now().isoformat(),
-        "last_notified_at": datetime.now().isoformat() if notified else None,
+        "last_reason": reason,
+        "last_checked_at": now_iso,
+        "last_notified_at": now_iso if notified else None,
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "body_hash": body_hash,
     }
+
+
+def flush_state(state_file: str, state: dict):
+    """
+    Atomically write the full state dictionary to the JSON file.
     
-    with open(state_file, "w") as f:
-        json.dump(state, f, indent=2)
+    The state is written to a temporary file next to the target and moved
+    into place, so a crash mid-write never leaves a truncated state file.
+    
+    Args:
+        state_file: Path to state file
+        state: State dictionary to persist
+    """
+    tmp_file = f"{state_file}.tmp"
+    try:
+        if orjson is not None:
+            data = orjson.dumps(state, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(state, indent=2, ensure_ascii=False).encode("utf-8")
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, state_file)
+    except BaseException:
+        # Don't leave a half-written temp file next to the real state
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
 
 
 def send_discord_notification(webhook_url: str, product_name: str, url: str, reason: str, verbose: bool = False) -> bool:
@@ -355,6 +1155,7 @@ def send_discord_notification(webhook_url: str, product_name: str, url: str, rea
     
     Args:
         webhook_url: Discord webhook URL
+        product_name: Name of the product
         url: Product URL
         reason: Reason for notification
         verbose: Enable verbose logging
@@ -363,16 +1164,21 @@ def send_discord_notification(webhook_url: str, product_name: str, url: str, rea
         True if notification sent successfully, False otherwise
     """
     try:
-        content = (
-            f"🛒 **Restock Alert: {product_name}**\n\n"
-            f"**Status:** BUYABLE\n"
-            f"**Reason:** {reason}\n"
-            f"**URL:** {url}"
-        )
-        
+        content = NOTIFY_TEMPLATE.format(product_name=product_name, reason=reason, url=url)
         payload = {"content": content}
+        # Encode once up front (with orjson when available) and send raw bytes,
+        # so requests neither re-serializes nor re-measures the body
+        if orjson is not None:
+            body = orjson.dumps(payload)
+        else:
+            body = json.dumps(payload).encode("utf-8")
         
-        response = requests.post(webhook_url, json=payload, timeout=10)
+        response = _SESSION.post(
+            webhook_url,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            timeout=10,
+        )
         response.raise_for_status()
         
         if verbose:
@@ -429,8 +1235,242 @@ def maybe_notify(
     return False
 
 
-def main():
-    """Main entry point."""
+class CheckResult(NamedTuple):
+    """Outcome of checking one product."""
+    product_name: str
+    status: str
+    reason: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    url: Optional[str] = None
+    body_hash: Optional[str] = None
+
+
+def check_product(
+    product: dict,
+    state: dict,
+    args: argparse.Namespace,
+) -> CheckResult:
+    """
+    Fetch and evaluate a single product.
+    
+    Args:
+        product: Product entry with "name", "url" and optional "type"
+        state: Previously loaded state dictionary (read-only here)
+        args: Parsed command-line arguments
+        
+    Returns:
+        CheckResult with the status, reason, page validators and body hash
+        
+    Raises:
+        requests.RequestException: If the page could not be fetched
+    """
+    product_name = product["name"]
+    product_url = product["url"]
+    product_type = product.get("type", "japanblue")
+    
+    if args.verbose:
+        print(f"\nChecking {product_name}...", file=sys.stderr)
+    
+    # Get previous status for this product
+    product_state = state.get("products", {}).get(product_name, {})
+    previous_status = product_state.get("last_status")
+    
+    if args.verbose:
+        print(f"Previous status: {previous_status}", file=sys.stderr)
+    
+    # Fetch the page; the request is only made conditional when there is a
+    # previous status to fall back on if the server answers 304, and when the
+    # stored validators came from this same URL (--url reuses one name for
+    # whatever URL is passed)
+    revalidate = previous_status is not None and product_state.get("url") == product_url
+    
+    # Shopify pages are settled as soon as the variant's product JSON arrives
+    stop_when = None
+    variant_id = _shopify_variant_id(product_url) if product_type == "shopify" else None
+    if variant_id:
+        stop_when = shopify_variant_settled(variant_id)
+    
+    try:
+        fetched = fetch_html(
+            product_url,
+            args.verbose,
+            args.cache_ttl,
+            product_state.get("etag") if revalidate else None,
+            product_state.get("last_modified") if revalidate else None,
+            stop_when,
+        )
+    except NotBuyableShortcut as e:
+        # Settled by the HEAD pre-check; there is no page to parse or revalidate
+        fetched = FetchResult(None, None, None)
+        current_status = "NOT_BUYABLE"
+        reason = e.reason
+        result_hash = None
+    else:
+        stored_hash = product_state.get("body_hash")
+        if fetched.html is None:
+            # 304 Not Modified: the page, and therefore the status, is unchanged
+            current_status = previous_status
+            reason = product_state.get("last_reason") or "Page not modified since last check"
+            result_hash = stored_hash
+        elif revalidate and stored_hash == _result_hash(
+            fetched.body_hash, previous_status, product_state.get("last_reason")
+        ):
+            # Same bytes as the page the stored status and reason came from,
+            # even though the server doesn't validate them; parsing again
+            # would give the same result
+            if args.verbose:
+                print("Page body unchanged since last check; skipping parse", file=sys.stderr)
+            current_status = previous_status
+            reason = product_state.get("last_reason")
+            result_hash = stored_hash
+        else:
+            buyable, reason = get_buyable_status(fetched.html, product_type, product_url)
+            
+            # Determine status string
+            current_status = "BUYABLE" if buyable else "NOT_BUYABLE"
+            result_hash = _result_hash(fetched.body_hash, current_status, reason)
+    
+    return CheckResult(
+        product_name,
+        current_status,
+        reason,
+        fetched.etag,
+        fetched.last_modified,
+        product_url,
+        result_hash,
+    )
+
+
+def run_checks(
+    products_to_check: list,
+    state: dict,
+    webhook_url: Optional[str],
+    args: argparse.Namespace,
+) -> Tuple[bool, bool]:
+    """
+    Check every product once and record the results in the in-memory state.
+    
+    Args:
+        products_to_check: Product entries to check
+        state: State dictionary, updated in place
+        webhook_url: Discord webhook URL or None
+        args: Parsed command-line arguments
+        
+    Returns:
+        Tuple of (all_successful: bool, changed: bool), where changed is True
+        if any product's status differs from its previous one
+    """
+    all_successful = True
+    changed = False
+    
+    def record(result: CheckResult, notified: bool = False):
+        # Record state on the main thread; written once after all checks
+        update_state(
+            state,
+            result.product_name,
+            result.status,
+            notified,
+            result.reason,
+            result.etag,
+            result.last_modified,
+            result.url,
+            result.body_hash,
+        )
+    
+    # Check products concurrently; each check is independent network I/O.
+    # A status change's Discord notification is handed back to the pool
+    # after its status line is printed, so the webhook POST overlaps the
+    # remaining checks instead of delaying the output.
+    max_workers = min(MAX_CONCURRENT_CHECKS, len(products_to_check))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(check_product, product, state, args): product
+            for product in products_to_check
+        }
+        notifications = {}
+        
+        for future in as_completed(futures):
+            product_name = futures[future]["name"]
+            
+            try:
+                result = future.result()
+                
+                # Print result (one line per product)
+                print(f"{result.product_name}: {result.status} - {result.reason}")
+                
+                previous_status = state.get("products", {}).get(result.product_name, {}).get("last_status")
+                if result.status != previous_status:
+                    changed = True
+                    notify_future = executor.submit(
+                        maybe_notify,
+                        previous_status,
+                        result.status,
+                        webhook_url,
+                        result.product_name,
+                        result.url,
+                        result.reason,
+                        args.dry_run,
+                        args.verbose,
+                    )
+                    notifications[notify_future] = result
+                else:
+                    record(result)
+                
+            except requests.RequestException as e:
+                print(f"{product_name}: NOT_BUYABLE - Network error: {e}", file=sys.stderr)
+                all_successful = False
+            except Exception as e:
+                print(f"{product_name}: NOT_BUYABLE - Unexpected error: {e}", file=sys.stderr)
+                if args.verbose:
+                    import traceback
+                    traceback.print_exc()
+                all_successful = False
+        
+        # The state write waits for the POSTs so it can record whether
+        # each notification actually went out
+        for future in as_completed(notifications):
+            result = notifications[future]
+            try:
+                notified = future.result()
+            except Exception as e:
+                print(f"{result.product_name}: Notification error: {e}", file=sys.stderr)
+                notified = False
+            record(result, notified)
+    
+    return all_successful, changed
+
+
+def _next_interval(interval: int, changed: bool, args: argparse.Namespace) -> int:
+    """
+    Pick the wait before the next watch-mode pass.
+    
+    Polls quickly right after a change and doubles the wait, up to
+    --max-interval, for every pass in which nothing changed.
+    
+    Args:
+        interval: Seconds waited before the pass that just finished
+        changed: Whether any product's status changed in that pass
+        args: Parsed command-line arguments
+        
+    Returns:
+        Seconds to sleep before the next pass
+    """
+    if changed:
+        return args.min_interval
+    return min(interval * 2, args.max_interval)
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    """
+    Parse and validate the command line.
+    
+    Args:
+        argv: Arguments to parse (defaults to sys.argv[1:])
+        
+    Returns:
+        Parsed command-line arguments
+    """
     parser = argparse.ArgumentParser(
         description="Monitor product pages for restock availability"
     )
@@ -455,16 +1495,60 @@ def main():
         action="store_true",
         help="Enable verbose debug logging",
     )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=0,
+        help=(
+            "Reuse pages fetched within this many seconds from a local cache "
+            f"in {CACHE_DIR} (default: 0, disabled; keep small to avoid missing restocks)"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-check on an adaptive interval instead of exiting",
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=int,
+        default=DEFAULT_MIN_INTERVAL,
+        help=f"Watch mode: seconds between checks right after a change (default: {DEFAULT_MIN_INTERVAL})",
+    )
+    parser.add_argument(
+        "--max-interval",
+        type=int,
+        default=DEFAULT_MAX_INTERVAL,
+        help=f"Watch mode: longest wait between checks while nothing changes (default: {DEFAULT_MAX_INTERVAL})",
+    )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
-    # Get Discord webhook URL from environment
+    if args.watch and not 0 < args.min_interval <= args.max_interval:
+        parser.error("--min-interval must be positive and no greater than --max-interval")
+    return args
+
+
+def main():
+    """Main entry point."""
+    args = parse_args()
+    
+    # Get Discord webhook URL from environment, falling back to a .env file
     webhook_url = os.environ.get("DISCORD_WEBHOOK_URL")
+    if not webhook_url:
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            # python-dotenv is optional; without it only the environment counts
+            pass
+        else:
+            load_dotenv()
+            webhook_url = os.environ.get("DISCORD_WEBHOOK_URL")
     
     if args.verbose and not webhook_url:
         print("DISCORD_WEBHOOK_URL not set; notifications disabled", file=sys.stderr)
     
-    # Load previous state
+    # Load previous state once; results are collected in memory
     state = load_state(args.state_file)
     
     # Determine which products to check
@@ -475,63 +1559,39 @@ def main():
         # Check all configured products
         products_to_check = PRODUCTS
     
-    all_successful = True
-    
-    # Check each product
-    for product in products_to_check:
-        product_name = product["name"]
-        product_url = product["url"]
-        product_type = product.get("type", "japanblue")
-        
+    if not args.watch:
         try:
-            if args.verbose:
-                print(f"\nChecking {product_name}...", file=sys.stderr)
-            
-            # Get previous status for this product
-            product_state = state.get("products", {}).get(product_name, {})
-            previous_status = product_state.get("last_status")
-            
-            if args.verbose:
-                print(f"Previous status: {previous_status}", file=sys.stderr)
-            
-            # Fetch and analyze page
-            html = fetch_html(product_url, args.verbose)
-            buyable, reason = get_buyable_status(html, product_type, product_url)
-            
-            # Determine status string
-            current_status = "BUYABLE" if buyable else "NOT_BUYABLE"
-            
-            # Print result (one line per product)
-            print(f"{product_name}: {current_status} - {reason}")
-            
-            # Check if we should notify
-            notified = maybe_notify(
-                previous_status,
-                current_status,
-                webhook_url,
-                product_name,
-                product_url,
-                reason,
-                args.dry_run,
-                args.verbose,
+            all_successful, _ = run_checks(products_to_check, state, webhook_url, args)
+        finally:
+            # Persist all product results in a single write
+            flush_state(args.state_file, state)
+        
+        # Exit with success code (0) if all checks completed
+        # Only exit with error code (1) for actual failures
+        sys.exit(0 if all_successful else 1)
+    
+    # Watch mode: keep the session and state in memory between passes and
+    # poll quickly after a change, backing off while nothing happens
+    interval = args.min_interval
+    loaded_mtime = state_mtime(args.state_file)
+    try:
+        while True:
+            state, loaded_mtime = reload_state_if_changed(
+                state, loaded_mtime, args.state_file, args.verbose
             )
             
-            # Save state for this product
-            save_state(args.state_file, product_name, current_status, notified)
+            try:
+                _, changed = run_checks(products_to_check, state, webhook_url, args)
+            finally:
+                flush_state(args.state_file, state)
+                loaded_mtime = state_mtime(args.state_file)
             
-        except requests.RequestException as e:
-            print(f"{product_name}: NOT_BUYABLE - Network error: {e}", file=sys.stderr)
-            all_successful = False
-        except Exception as e:
-            print(f"{product_name}: NOT_BUYABLE - Unexpected error: {e}", file=sys.stderr)
+            interval = _next_interval(interval, changed, args)
             if args.verbose:
-                import traceback
-                traceback.print_exc()
-            all_successful = False
-    
-    # Exit with success code (0) if all checks completed
-    # Only exit with error code (1) for actual failures
-    sys.exit(0 if all_successful else 1)
+                print(f"Next check in {interval}s", file=sys.stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        sys.exit(0)
 
 
 if __name__ == "__main__":
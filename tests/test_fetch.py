@@ -0,0 +1,265 @@
+"""fetch_html against a local keep-alive HTTP server."""
+
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import japanblue_restock_watch as watch
+
+VARIANT_ID = "27890666602598"
+PRODUCT_JSON = (
+    '<script id="ProductJson-main" type="application/json">'
+    f'{{"variants": [{{"id": {VARIANT_ID}, "available": true}}]}}'
+    "</script>"
+)
+BUYABLE_PAGE = '<html><body><button name="add-to-cart">Add to cart</button></body></html>'
+ARGS = argparse.Namespace(verbose=False, cache_ttl=0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+    
+    def do_HEAD(self):
+        self.server.heads += 1
+        self.send_response(self.server.head_status)
+        self.send_header("Content-Length", "0")
+        if self.server.etag:
+            self.send_header("ETag", self.server.etag)
+        self.end_headers()
+    
+    def do_GET(self):
+        self.server.gets += 1
+        if self.server.unavailable:
+            self.server.unavailable -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.server.etag and self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.server.etag)
+            self.end_headers()
+            return
+        body = self.server.pages[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if self.server.etag:
+            self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.truncate:
+            # Drop the connection halfway through the promised body
+            self.server.truncate -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.pages = {}
+    httpd.connections = 0
+    httpd.heads = 0
+    httpd.head_status = 200
+    httpd.gets = 0
+    httpd.truncate = 0
+    httpd.unavailable = 0
+    httpd.etag = None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url_for(server, path):
+    return f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def check(server, state, path="/p"):
+    """Run check_product() against the server and record the result in state."""
+    result = watch.check_product({"name": "Jeans", "url": url_for(server, path)}, state, ARGS)
+    watch.update_state(
+        state,
+        result.product_name,
+        result.status,
+        False,
+        result.reason,
+        result.etag,
+        result.last_modified,
+        result.url,
+        result.body_hash,
+    )
+    return result
+
+
+def scripts(count: int) -> str:
+    return "".join(f"<script>var s{i} = '{'x' * 200}';</script>" for i in range(count))
+
+
+def test_stop_when_sees_each_script_block_once(server):
+    server.pages["/p"] = f"<html><head>{scripts(3000)}</head><body></body></html>".encode()
+    seen = []
+    
+    def stop_when(segment):
+        seen.append(segment)
+        return False
+    
+    result = watch.fetch_html(url_for(server, "/p"), stop_when=stop_when)
+    
+    # Segments are disjoint, so the total work stays linear in the page size
+    assert sum(len(segment) for segment in seen) <= len(result.html)
+    assert sum(segment.count("</script>") for segment in seen) == 3000
+
+
+def test_early_stop_keeps_connection_when_remainder_is_small(server):
+    server.pages["/p"] = f"<html><head>{PRODUCT_JSON}</head><body>{'y' * 20000}</body></html>".encode()
+    url = url_for(server, "/p")
+    stop_when = watch.shopify_variant_settled(VARIANT_ID)
+    
+    for _ in range(3):
+        result = watch.fetch_html(url, stop_when=stop_when)
+        assert watch._find_shopify_variant(result.html, VARIANT_ID)["available"] is True
+    
+    assert server.connections == 1
+
+
+def test_early_stop_drops_connection_when_remainder_is_large(server):
+    filler = "y" * (watch.MAX_DRAIN_BYTES * 4)
+    server.pages["/p"] = f"<html><head>{PRODUCT_JSON}</head><body>{filler}</body></html>".encode()
+    url = url_for(server, "/p")
+    
+    stop_when = watch.shopify_variant_settled(VARIANT_ID)
+    
+    # Reading off the rest would cost more than a new connection
+    for _ in range(2):
+        result = watch.fetch_html(url, stop_when=stop_when)
+        assert len(result.html) < len(filler)
+    
+    assert server.connections == 2
+
+
+def test_inconclusive_variant_json_does_not_stop_early(server):
+    # "available": null settles nothing, so the sold-out text further down
+    # the page must still be downloaded
+    product_json = PRODUCT_JSON.replace('"available": true', '"available": null')
+    filler = "y" * (watch.MAX_DRAIN_BYTES * 2)
+    server.pages["/p"] = (
+        f"<html><head>{product_json}</head><body>{filler}<span>Sold out</span></body></html>"
+    ).encode()
+    url = url_for(server, "/p")
+    
+    result = watch.fetch_html(url, stop_when=watch.shopify_variant_settled(VARIANT_ID))
+    
+    assert watch.get_buyable_status(result.html, "shopify", f"{url}?variant={VARIANT_ID}") == (
+        False,
+        "Sold out message found",
+    )
+
+
+def test_body_read_failure_is_retried(server, monkeypatch):
+    monkeypatch.setattr(watch, "_backoff_delay", lambda attempt: 0)
+    page = f"<html><body>{'z' * 50000}</body></html>"
+    server.pages["/p"] = page.encode()
+    server.truncate = watch.MAX_RETRIES - 1
+    
+    assert watch.fetch_html(url_for(server, "/p")).html == page
+    assert server.gets == watch.MAX_RETRIES
+
+
+def test_body_read_failure_gives_up_after_max_retries(server, monkeypatch):
+    monkeypatch.setattr(watch, "_backoff_delay", lambda attempt: 0)
+    server.pages["/p"] = f"<html><body>{'z' * 50000}</body></html>".encode()
+    server.truncate = watch.MAX_RETRIES
+    
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        watch.fetch_html(url_for(server, "/p"))
+    assert server.gets == watch.MAX_RETRIES
+
+
+def test_status_and_body_retries_share_one_budget(server, monkeypatch):
+    monkeypatch.setattr(watch, "_backoff_delay", lambda attempt: 0)
+    server.pages["/p"] = f"<html><body>{'z' * 50000}</body></html>".encode()
+    server.unavailable = 1
+    server.truncate = watch.MAX_RETRIES
+    
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        watch.fetch_html(url_for(server, "/p"))
+    assert server.gets == watch.MAX_RETRIES
+
+
+def test_not_modified_reuses_stored_status(server, monkeypatch):
+    # Leave revalidation to the conditional GET alone
+    monkeypatch.setattr(watch, "head_precheck", lambda *args: False)
+    server.pages["/p"] = BUYABLE_PAGE.encode()
+    server.etag = '"v1"'
+    state = {"products": {}}
+    check(server, state)
+    # Only a parse could notice this; the 304 must not lead to one
+    server.pages["/p"] = b"<html><body>Out of stock</body></html>"
+    
+    result = check(server, state)
+    
+    assert server.gets == 2
+    assert (result.status, result.reason) == ("BUYABLE", "Add-to-cart button found and enabled")
+    assert state["products"]["Jeans"]["etag"] == '"v1"'
+
+
+@pytest.mark.parametrize("status", [404, 410])
+def test_head_gone_settles_without_get(server, status):
+    server.head_status = status
+    state = {"products": {}}
+    
+    result = check(server, state)
+    
+    assert server.gets == 0
+    assert (result.status, result.reason) == ("NOT_BUYABLE", f"HEAD {status} (product page gone)")
+    assert state["products"]["Jeans"]["last_status"] == "NOT_BUYABLE"
+
+
+@pytest.mark.parametrize("status", [405, 501])
+def test_head_unsupported_host_is_remembered(server, monkeypatch, status):
+    monkeypatch.setattr(watch, "_HEAD_UNSUPPORTED_HOSTS", set())
+    server.head_status = status
+    server.pages["/p"] = BUYABLE_PAGE.encode()
+    url = url_for(server, "/p")
+    
+    for _ in range(2):
+        assert watch.fetch_html(url).html == BUYABLE_PAGE
+    
+    assert server.heads == 1
+    assert server.gets == 2
+    assert watch._HEAD_UNSUPPORTED_HOSTS == {f"127.0.0.1:{server.server_port}"}
+
+
+def test_head_with_unchanged_etag_skips_get(server):
+    server.pages["/p"] = BUYABLE_PAGE.encode()
+    server.etag = '"v1"'
+    state = {"products": {}}
+    check(server, state)
+    
+    result = check(server, state)
+    
+    assert server.gets == 1
+    assert (result.status, result.reason) == ("BUYABLE", "Add-to-cart button found and enabled")
+    
+    server.pages["/p"] = b"<html><body>Out of stock</body></html>"
+    server.etag = '"v2"'
+    
+    result = check(server, state)
+    
+    assert server.gets == 2
+    assert (result.status, result.reason) == ("NOT_BUYABLE", "Out of Stock message found")
+    assert state["products"]["Jeans"]["etag"] == '"v2"'
@@ -0,0 +1,164 @@
+"""Availability checks run against canned product pages."""
+
+import pytest
+
+import japanblue_restock_watch as watch
+
+FILLER = "<p>" + "lorem ipsum " * 20 + "</p>"
+SHOPIFY_URL = "https://www.theculturedcup.com/products/x?variant=27890666602598"
+
+
+def page(body: str) -> str:
+    return f"<html><body>{FILLER}{body}</body></html>"
+
+
+@pytest.mark.parametrize(
+    "html, expected",
+    [
+        ("<p>In <b>stock</b></p>", "in stock"),
+        ('<span x-text="stock > 0 ? \'In stock\' : \'Sold out\'">In stock</span>', "in stock"),
+        ('<div x-show="qty > 0" data-msg="out of stock">ok</div>', "ok"),
+        ("<script>var s = 'Sold out';</script><p>Add to cart</p>", "add to cart"),
+        ("<!-- Sold out --><p>A &amp; B</p>", "a & b"),
+        ("<p>1 < 2</p>", "1 < 2"),
+    ],
+)
+def test_visible_text(html, expected):
+    assert watch._visible_text(html).lower() == expected
+
+
+def test_attribute_with_gt_does_not_leak_sold_out():
+    html = page(
+        '<span x-text="stock > 0 ? \'In stock\' : \'Sold out\'">In stock</span>'
+        "<button>Add to cart</button>"
+    )
+    assert watch.get_buyable_status(html, "shopify", "https://example.com/products/p") == (
+        True,
+        "Add-to-cart button found and enabled (Shopify)",
+    )
+
+
+def test_attribute_with_gt_does_not_leak_out_of_stock():
+    html = page(
+        '<div x-show="qty > 0" data-msg="out of stock">ok</div>'
+        '<button name="add-to-cart">Add to cart</button>'
+    )
+    assert watch.get_buyable_status(html) == (True, "Add-to-cart button found and enabled")
+
+
+# Expected results are what the original BeautifulSoup implementation
+# (soup.select() with the add-to-cart selectors, then get_text()) returned
+ENABLED = (True, "Add-to-cart button found and enabled")
+DISABLED = (False, "Add-to-cart button found but disabled")
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    [
+        ('<button name="add-to-cart">Add</button>', ENABLED),
+        ('<button name="add-to-cart" disabled>Add</button>', DISABLED),
+        ('<button class="btn add-to-cart">x</button><button class="add-to-cart" aria-disabled="TRUE">y</button>', DISABLED),
+        ('<button data-action="do-add-to-cart">x</button>', ENABLED),
+        ('<button class="product-addtocart">Buy</button>', ENABLED),
+        ('<input name="add-to-cart" type="hidden" value="1">', ENABLED),
+        ('<input type="submit" value="Add to Cart" disabled>', DISABLED),
+        ('<input type="submit" value="Add to Cart">', ENABLED),
+        ('<a class="add-to-cart" href="#">Buy</a>', ENABLED),
+        ("<div><button>Add <span>to</span> cart</button></div>", ENABLED),
+        ("<button disabled>Add to Cart</button><button>add to cart</button>", DISABLED),
+        ("<button>add to cart</button><button disabled>Add to Cart</button>", ENABLED),
+        ('<a href="#">add to cart <b>now</b></a>', ENABLED),
+        ('<input type="text" value="cart">', ENABLED),
+        ("<button><a>add to cart</a></button>", ENABLED),
+        ("<button>cart &amp; add to cart</button>", ENABLED),
+        ('<button aria-disabled="true">Add to cart</button>', DISABLED),
+        (
+            "<p>Please select the product option(s)</p><button disabled>Add to cart</button>",
+            (False, "Product options required but not selected"),
+        ),
+        ("<p>Please select the product option(s)</p>", (False, "Product options required but not selected")),
+        ('<p>Out of Stock</p><button name="add-to-cart">Add</button>', (False, "Out of Stock message found")),
+        ("<p>Your cart is empty</p>", (False, "Add-to-cart button not found")),
+    ],
+)
+def test_japanblue_matches_baseline(body, expected):
+    assert watch.get_buyable_status(page(body)) == expected
+
+
+def test_japanblue_short_page():
+    assert watch.get_buyable_status("<html><body>hi</body></html>") == (
+        False,
+        "Page content too short (possible error page)",
+    )
+
+
+SHOPIFY_ENABLED = (True, "Add-to-cart button found and enabled (Shopify)")
+SHOPIFY_DISABLED = (False, "Add-to-cart button disabled")
+SHOPIFY_UNCLEAR = (False, "Unable to confirm availability (Shopify - no clear indicators)")
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    [
+        ("<button>Add to cart</button>", SHOPIFY_ENABLED),
+        ("<button><span>Add to cart</span></button>", SHOPIFY_ENABLED),
+        # Two children (whitespace and <span>), so the button has no .string
+        ("<button> <span>Add to cart</span></button>", SHOPIFY_UNCLEAR),
+        ('<button aria-disabled="true">Add to cart</button>', SHOPIFY_UNCLEAR),
+        ('<button aria-disabled="false">Add to cart</button>', SHOPIFY_UNCLEAR),
+        ("<button disabled>Add to cart</button>", SHOPIFY_DISABLED),
+        ('<input type="submit" disabled value="x"><button>Add to cart</button>', SHOPIFY_DISABLED),
+        ('<div class="cart-disabled">x</div><button>Add to cart</button>', SHOPIFY_DISABLED),
+        ("<button>Add &amp; add to cart</button>", SHOPIFY_ENABLED),
+        ("<button><span><b>ADD TO CART</b></span></button>", SHOPIFY_ENABLED),
+        ("<div>Add to cart</div>", SHOPIFY_UNCLEAR),
+        ('<form><button type="submit">Add to cart</button></form><button>Other</button>', SHOPIFY_ENABLED),
+        ("<span>Sold Out</span><button>Add to cart</button>", (False, "Sold out message found")),
+    ],
+)
+def test_shopify_buttons_match_baseline(body, expected):
+    assert watch.get_buyable_status(page(body), "shopify", "https://example.com/products/p") == expected
+
+
+@pytest.mark.parametrize(
+    "variant, expected",
+    [
+        ('"available": false', (False, "Variant 27890666602598 marked as unavailable")),
+        ('"inventory_quantity": 0', (False, "Variant 27890666602598 has zero inventory")),
+        ('"available": true', (True, "Variant 27890666602598 marked as available in product JSON")),
+    ],
+)
+def test_shopify_product_json(variant, expected):
+    body = (
+        '<script id="ProductJson-main" type="application/json">'
+        f'{{"variants": [{{"id": 27890666602598, {variant}}}]}}'
+        "</script><button>Add to cart</button>"
+    )
+    assert watch.get_buyable_status(page(body), "shopify", SHOPIFY_URL) == expected
+
+
+SCHEMA_ORG = (
+    '<script type="application/ld+json">'
+    '{"@type": "Offer", "availability": "https://schema.org/InStock"}'
+    "</script><link itemprop=\"availability\" href=\"https://schema.org/OutOfStock\">"
+)
+
+
+def test_schema_org_availability_skips_text_render(monkeypatch):
+    rendered = []
+    real_visible_text = watch._visible_text
+    monkeypatch.setattr(watch, "_visible_text", lambda html: rendered.append(html) or real_visible_text(html))
+    
+    html = page(SCHEMA_ORG + '<button name="add-to-cart">Add to cart</button>')
+    
+    assert watch.get_buyable_status(html) == ENABLED
+    assert rendered == []
+
+
+@pytest.mark.parametrize(
+    "message",
+    ["Out of stock", "Out of <b>stock</b>", "out&#32;of stock", "<span>Out</span> <span>of</span> stock"],
+)
+def test_out_of_stock_found_through_markup(message):
+    html = page(f'<p>{message}</p><button name="add-to-cart">Add to cart</button>')
+    assert watch.get_buyable_status(html) == (False, "Out of Stock message found")
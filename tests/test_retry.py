@@ -0,0 +1,40 @@
+"""The session's urllib3 retry policy."""
+
+from urllib3.exceptions import ProtocolError
+from urllib3.response import HTTPResponse
+
+import japanblue_restock_watch as watch
+
+
+def failed(retry, times):
+    for _ in range(times):
+        retry = retry.increment(method="GET", url="/", error=ProtocolError("reset"))
+    return retry
+
+
+def test_no_backoff_before_first_failure():
+    assert watch._RETRY.get_backoff_time() == 0
+
+
+def test_backoff_uses_full_jitter():
+    for failures, bound in ((1, watch.INITIAL_BACKOFF), (2, 2 * watch.INITIAL_BACKOFF)):
+        retry = failed(watch._RETRY, failures)
+        delays = [retry.get_backoff_time() for _ in range(200)]
+        # Spread over the whole [0, bound] range, first retry included
+        assert all(0 <= delay <= bound for delay in delays)
+        assert min(delays) < bound / 4 and max(delays) > bound * 3 / 4
+
+
+def test_backoff_is_capped():
+    for _ in range(200):
+        assert watch._backoff_delay(20) <= watch.MAX_BACKOFF
+
+
+def test_retry_after_is_capped():
+    response = HTTPResponse(headers={"Retry-After": "3600"}, status=429)
+    assert watch._RETRY.get_retry_after(response) == watch.MAX_BACKOFF
+
+
+def test_short_retry_after_is_honoured():
+    response = HTTPResponse(headers={"Retry-After": "5"}, status=429)
+    assert watch._RETRY.get_retry_after(response) == 5
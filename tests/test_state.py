@@ -0,0 +1,110 @@
+"""State-file round trips and the state-backed parse skip."""
+
+import argparse
+
+import pytest
+
+import japanblue_restock_watch as watch
+
+STATE = {
+    "products": {
+        "Café Blend – 8oz": {
+            "last_status": "BUYABLE",
+            "last_reason": "Add-to-cart button found and enabled",
+            "last_checked_at": "2025-12-14T14:23:00",
+            "last_notified_at": None,
+            "url": "https://example.com/products/cafe",
+            "etag": '"abc"',
+            "last_modified": None,
+            "body_hash": None,
+        },
+        "Empty": {},
+    }
+}
+
+
+def test_flush_and_load_round_trip(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    watch.flush_state(state_file, STATE)
+    assert watch.load_state(state_file) == STATE
+
+
+def test_state_bytes_do_not_depend_on_orjson(tmp_path, monkeypatch):
+    pytest.importorskip("orjson")
+    with_orjson = tmp_path / "orjson.json"
+    watch.flush_state(str(with_orjson), STATE)
+    
+    monkeypatch.setattr(watch, "orjson", None)
+    without_orjson = tmp_path / "json.json"
+    watch.flush_state(str(without_orjson), STATE)
+    
+    assert with_orjson.read_bytes() == without_orjson.read_bytes()
+
+
+PAGE = "<html><body>" + "x" * 200 + '<button name="add-to-cart">Add to cart</button></body></html>'
+URL = "https://example.com/products/jeans"
+ARGS = argparse.Namespace(verbose=False, cache_ttl=0, dry_run=True)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Serve PAGE without validators and count get_buyable_status() calls."""
+    calls = []
+    real_status = watch.get_buyable_status
+    
+    def fetch_html(url, *args, **kwargs):
+        return watch.FetchResult(PAGE, None, None, watch._body_hash(PAGE.encode("utf-8")))
+    
+    def get_buyable_status(*args, **kwargs):
+        calls.append(args)
+        return real_status(*args, **kwargs)
+    
+    monkeypatch.setattr(watch, "fetch_html", fetch_html)
+    monkeypatch.setattr(watch, "get_buyable_status", get_buyable_status)
+    return calls
+
+
+def check(state):
+    result = watch.check_product({"name": "Jeans", "url": URL}, state, ARGS)
+    watch.update_state(
+        state,
+        result.product_name,
+        result.status,
+        False,
+        result.reason,
+        result.etag,
+        result.last_modified,
+        result.url,
+        result.body_hash,
+    )
+    return result
+
+
+def test_unchanged_body_skips_parse(parses):
+    state = {"products": {}}
+    check(state)
+    result = check(state)
+    
+    assert len(parses) == 1
+    assert (result.status, result.reason) == ("BUYABLE", "Add-to-cart button found and enabled")
+
+
+def test_edited_status_is_not_reused(parses):
+    state = {"products": {}}
+    check(state)
+    state["products"]["Jeans"]["last_status"] = "NOT_BUYABLE"
+    
+    result = check(state)
+    
+    assert len(parses) == 2
+    assert (result.status, result.reason) == ("BUYABLE", "Add-to-cart button found and enabled")
+
+
+def test_detector_change_forces_parse(parses, monkeypatch):
+    state = {"products": {}}
+    check(state)
+    monkeypatch.setattr(watch, "DETECTOR_VERSION", watch.DETECTOR_VERSION + 1)
+    
+    check(state)
+    
+    assert len(parses) == 2
@@ -0,0 +1,84 @@
+"""Watch-mode interval, state reloads and command-line handling."""
+
+import os
+
+import pytest
+
+import japanblue_restock_watch as watch
+
+
+def test_interval_doubles_up_to_max_while_unchanged():
+    args = watch.parse_args(["--watch", "--min-interval", "60", "--max-interval", "300"])
+    interval = args.min_interval
+    waits = []
+    for _ in range(4):
+        interval = watch._next_interval(interval, False, args)
+        waits.append(interval)
+    
+    assert waits == [120, 240, 300, 300]
+
+
+def test_change_resets_interval_to_min():
+    args = watch.parse_args(["--watch", "--min-interval", "60", "--max-interval", "300"])
+    
+    assert watch._next_interval(300, True, args) == 60
+
+
+@pytest.mark.parametrize("argv", [
+    ["--watch", "--min-interval", "0"],
+    ["--watch", "--min-interval", "-5"],
+    ["--watch", "--min-interval", "600", "--max-interval", "300"],
+])
+def test_invalid_intervals_are_rejected(argv, capsys):
+    with pytest.raises(SystemExit) as exc:
+        watch.parse_args(argv)
+    
+    assert exc.value.code == 2
+    assert "--min-interval must be positive" in capsys.readouterr().err
+
+
+def test_intervals_are_only_validated_in_watch_mode():
+    args = watch.parse_args(["--min-interval", "0"])
+    
+    assert not args.watch
+
+
+def test_state_is_kept_while_file_is_unchanged(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    state = {"products": {"Jeans": {"last_status": "BUYABLE"}}}
+    watch.flush_state(state_file, state)
+    mtime = watch.state_mtime(state_file)
+    
+    reloaded, reloaded_mtime = watch.reload_state_if_changed(state, mtime, state_file)
+    
+    assert reloaded is state
+    assert reloaded_mtime == mtime
+
+
+def test_state_is_reloaded_after_outside_write(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    state = {"products": {"Jeans": {"last_status": "BUYABLE"}}}
+    watch.flush_state(state_file, state)
+    mtime = watch.state_mtime(state_file)
+    
+    edited = {"products": {"Jeans": {"last_status": "NOT_BUYABLE"}}}
+    watch.flush_state(state_file, edited)
+    # Make the change visible even on filesystems with coarse timestamps
+    os.utime(state_file, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    
+    reloaded, reloaded_mtime = watch.reload_state_if_changed(state, mtime, state_file)
+    
+    assert reloaded == edited
+    assert reloaded_mtime == mtime + 10 ** 9
+
+
+def test_missing_state_file_is_not_reloaded(tmp_path):
+    state_file = str(tmp_path / "state.json")
+    state = {"products": {}}
+    
+    reloaded, reloaded_mtime = watch.reload_state_if_changed(
+        state, watch.state_mtime(state_file), state_file
+    )
+    
+    assert reloaded is state
+    assert reloaded_mtime is None